@@ -22,7 +22,9 @@ class Website(AbstractManager):
         website_dir = get_homedir() / 'website'
         ip = get_config('generic', 'website_listen_ip')
         port = get_config('generic', 'website_listen_port')
+        # Threaded workers: a slow download or a long request doesn't block a whole process.
         return Popen(['gunicorn', '-w', '10',
+                      '-k', 'gthread', '--threads', '4',
                       '--graceful-timeout', '2', '--timeout', '300',
                       '-b', f'{ip}:{port}',
                       '--log-level', 'info',
@@ -1,21 +1,22 @@
+import atexit
 import hashlib
 import importlib
 import logging
+import os
 import re
 import shutil
 import sys
+import threading
 import traceback
 
 from datetime import datetime, timezone
 from functools import cached_property, lru_cache
 from io import BytesIO
 from pathlib import Path
-from typing import Optional, List, Union, Dict, cast, Set, Tuple
+from typing import Any, BinaryIO, Optional, List, Union, Dict, cast, Set, Tuple, TYPE_CHECKING
 from uuid import uuid4
-from zipfile import ZipFile
+from zipfile import ZipFile, ZIP_STORED
 
-import exiftool  # type: ignore
-import fitz  # type: ignore
 import magic
 import pikepdf
 
@@ -24,10 +25,8 @@ from pymisp import MISPEvent, MISPObject
 from pymisp.tools import make_binary_objects, FileObject
 from svglib.svglib import svg2rlg  # type: ignore
 from reportlab.graphics import renderPDF  # type: ignore
-import textract  # type: ignore
 from weasyprint import HTML, default_url_fetcher  # type: ignore
 
-from eml_parser import EmlParser
 from extract_msg import openMsg, Message
 
 from .default import get_config
@@ -36,6 +35,64 @@ from .helpers import make_bool, make_bool_for_redis
 from .storage_client import Storage
 from .text_parser import TextParser
 
+# NOTE: fitz (PyMuPDF), exiftool, textract and eml_parser are heavy and only needed by some
+#       file types, they're imported where they are used.
+if TYPE_CHECKING:
+    import exiftool  # type: ignore
+
+# Split CamelCase exiftool keys into words: "HTTPServer" -> "HTTP Server", "FileSize" -> "File Size"
+_CAMEL_ACRONYM_RE = re.compile(r'([A-Z]+)([A-Z][a-z])')
+_CAMEL_WORD_RE = re.compile(r'([a-z\d])([A-Z])')
+
+
+def _humanize_metadata_key(key: str) -> str:
+    key = key.split(':')[-1]
+    return _CAMEL_WORD_RE.sub(r'\1 \2', _CAMEL_ACRONYM_RE.sub(r'\1 \2', key))
+
+
+def _clean_metadata(raw: Dict[str, Any]) -> Dict[str, str]:
+    return {_humanize_metadata_key(key): value for key, value in raw.items()
+            if not key.lower().startswith(('sourcefile', 'exiftool:', 'file:'))}
+
+
+_EXIFTOOL_LOCK = threading.Lock()
+
+
+@lru_cache(64)
+def _get_exiftool(executable: Optional[str], pid: int) -> 'exiftool.ExifToolHelper':
+    """
+    Long running exiftool process (-stay_open), started on first use.
+    The pid is part of the key so a forked worker never talks to the process of its parent.
+    """
+    import exiftool  # type: ignore
+
+    et = exiftool.ExifToolHelper(executable=executable)
+
+    def _terminate() -> None:
+        if et.running:
+            et.terminate()
+
+    atexit.register(_terminate)
+    return et
+
+
+def exiftool_get_metadata(paths: List[Path]) -> List[Dict[str, Any]]:
+    """
+    Get the raw metadata of a list of files, in one round-trip to the shared exiftool process.
+    """
+    executable = get_config('generic', 'exiftool_path')
+    if not executable or not Path(executable).exists():
+        executable = None
+    with _EXIFTOOL_LOCK:
+        et = _get_exiftool(executable, os.getpid())
+        try:
+            return et.get_metadata([str(path) for path in paths])
+        except Exception:
+            # The process may be in a weird state, the next call will start a new one.
+            if et.running:
+                et.terminate()
+            raise
+
 
 @lru_cache
 def dirty_load_unoconverter():
@@ -45,6 +102,21 @@ def dirty_load_unoconverter():
     return module
 
 
+def file_digest(path: Path, algorithm: str, chunk_size: int=1 << 20) -> str:
+    """
+    Hash a file from disk without loading it in memory.
+    Uses hashlib.file_digest when available (python 3.11+), it hands the file descriptor to OpenSSL directly.
+    """
+    with path.open('rb', buffering=0) as f:
+        if hasattr(hashlib, 'file_digest'):
+            return hashlib.file_digest(f, algorithm).hexdigest()  # type: ignore[attr-defined]
+        h = hashlib.new(algorithm)
+        buf = memoryview(bytearray(chunk_size))
+        while (n := f.readinto(buf)):
+            h.update(buf[:n])
+        return h.hexdigest()
+
+
 def html_to_pdf(source: Union[str, bytes, Path], dest: str) -> None:
 
     def disable_fetch_weasyprint(url: str, timeout=10, ssl_context=None):
@@ -121,7 +193,7 @@ class File:
     }
 
     TYPE_EXTENSIONS: Dict[str, Set[str]] = {
-        'ARC': {'.zip', '.tar', '.gz', '.bz2', '.bz', '.rar', '.7z', 'lzma'},
+        'ARC': {'.zip', '.tar', '.gz', '.bz2', '.bz', '.rar', '.7z', '.lzma'},
         'BIN': {'.bin', '.iso'},
         'CSS': {'.css'},
         'CSV': {'.csv'},
@@ -139,6 +211,8 @@ class File:
         'TXT': {'.txt'},
         'XLS': {'.xls', '.xlsx', '.ods'}
     }
+    # Reverse of TYPE_EXTENSIONS, for direct lookup
+    _EXT_TO_TYPE: Dict[str, str] = {ext: type_ for type_, extensions in TYPE_EXTENSIONS.items() for ext in extensions}
     TYPE_ICONS: Dict[str, str] = {
         'ARC': 'file-zip',
         'BIN': 'file-binary',
@@ -182,6 +256,7 @@ class File:
     FOLDER_MODE = 0o2775
     FILE_MODE = 0o0664
     SUBPROCESS_TIMEOUT: int = 30
+    HASH_CHUNK_SIZE: int = 1 << 20
 
     DATA_CHARSETS: List[str] = [
         'utf8',
@@ -190,8 +265,28 @@ class File:
     ]
 
     @classmethod
-    def new_file(cls, filepath: Path, filename: str) -> 'File':
+    def from_stream(cls, stream: BinaryIO, filepath: Path, filename: str) -> 'File':
+        """
+        Write the content of a stream on disk, hashing it while it is copied so the file doesn't have to be read again.
+        :param stream: file-like object with the content of the file
+        :param filepath: where to write the file
+        :param filename: original filename as uploaded
+        """
+        if stream.seekable():
+            stream.seek(0)
+        hashes: Dict[str, Any] = {name: hashlib.new(name) for name in ('md5', 'sha1', 'sha256')}  # nosec B324, B303
+        size = 0
+        with filepath.open('wb') as f:
+            while chunk := stream.read(cls.HASH_CHUNK_SIZE):
+                f.write(chunk)
+                for h in hashes.values():
+                    h.update(chunk)
+                size += len(chunk)
         file = cls(filepath, original_filename=filename)
+        file.md5 = hashes['md5'].hexdigest()
+        file.sha1 = hashes['sha1'].hexdigest()
+        file.sha256 = hashes['sha256'].hexdigest()
+        file.size = size
         file.store()
         return file
 
@@ -319,15 +414,19 @@ class File:
         else:
             raise NoPreview('Preview not supported for this file format')
 
+        import fitz  # type: ignore
+
         for i, p in enumerate(to_convert):
-            doc = fitz.open(p)
-            if doc.needs_pass:
-                raise Unsupported("The PDF is password protected, this feature isn't supported yet.")
-            digits = len(str(doc.page_count))
-            for page in doc:
-                pix = page.get_pixmap()
-                img_name = self.directory / f"preview-{i}-{page.number:0{digits}}.png"
-                pix.save(img_name)
+            with fitz.open(p) as doc:
+                if doc.needs_pass:
+                    raise Unsupported("The PDF is password protected, this feature isn't supported yet.")
+                digits = len(str(doc.page_count))
+                for page in doc:
+                    pix = page.get_pixmap()
+                    img_name = self.directory / f"preview-{i}-{page.number:0{digits}}.png"
+                    pix.save(img_name)
+                    # Release the pixmap buffer before rendering the next page
+                    del pix
 
     @property
     def previews(self) -> List[Path]:
@@ -339,7 +438,8 @@ class File:
             return None
         archive_file = self.directory / 'previews.zip'
         if not archive_file.exists():
-            with ZipFile(archive_file, 'w') as zipObj:
+            # PNGs are already compressed, deflating them again is a waste of CPU
+            with ZipFile(archive_file, 'w', compression=ZIP_STORED) as zipObj:
                 for preview in self.previews:
                     zipObj.write(preview, arcname=preview.name)
 
@@ -383,14 +483,37 @@ class File:
     def __str__(self) -> str:
         return str(self.path)
 
+    def _compute_hashes(self) -> None:
+        """
+        Compute the missing hashes in a single pass over the file on disk.
+        """
+        if not self.path.exists():
+            return
+        missing = [name for name, value in (('md5', self._md5), ('sha1', self._sha1), ('sha256', self._sha256))
+                   if value is None]
+        if not missing:
+            return
+        if len(missing) == 1:
+            # Only one hash to compute, let OpenSSL do the loop
+            setattr(self, f'_{missing[0]}', file_digest(self.path, missing[0], self.HASH_CHUNK_SIZE))
+            return
+        hashes: Dict[str, Any] = {name: hashlib.new(name) for name in missing}  # nosec B324, B303
+        buf = memoryview(bytearray(self.HASH_CHUNK_SIZE))
+        with self.path.open('rb', buffering=0) as f:
+            while (n := f.readinto(buf)):
+                for h in hashes.values():
+                    h.update(buf[:n])
+        for name, h in hashes.items():
+            setattr(self, f'_{name}', h.hexdigest())
+
     @property
     def md5(self) -> str:
         """
         Property to get hexadecimal form of file content MD5 signature.
         :return (str|None): hexadecimal string or None if file is not reachable
         """
-        if self._md5 is None and self.data:
-            self._md5 = hashlib.md5(self.data.getvalue()).hexdigest() if self.data is not None else None  # nosec B324, B303
+        if self._md5 is None:
+            self._compute_hashes()
         return self._md5 if self._md5 else ''
 
     @md5.setter
@@ -403,8 +526,8 @@ class File:
         Property to get hexadecimal form of file content SHA1 signature.
         :return (str): hexadecimal string or None if file is not reachable
         """
-        if self._sha1 is None and self.data:
-            self._sha1 = hashlib.sha1(self.data.getvalue()).hexdigest() if self.data is not None else None  # nosec B324, B303
+        if self._sha1 is None:
+            self._compute_hashes()
         return self._sha1 if self._sha1 else ''
 
     @sha1.setter
@@ -417,8 +540,8 @@ class File:
         Property to get hexadecimal form of file content SHA256 signature.
         :return (str): hexadecimal string or None if file is not reachable
         """
-        if self._sha256 is None and self.data:
-            self._sha256 = hashlib.sha256(self.data.getvalue()).hexdigest() if self.data is not None else None
+        if self._sha256 is None:
+            self._compute_hashes()
         return self._sha256 if self._sha256 else ''
 
     @sha256.setter
@@ -427,8 +550,9 @@ class File:
 
     @cached_property
     def mime_type(self) -> str:
-        if self.data:
-            return magic.from_buffer(self.data.getvalue(), mime=True)
+        # libmagic reads the file itself, no need to load the content in memory
+        if self.path.exists():
+            return magic.from_file(str(self.path), mime=True)
         return ''
 
     def delete(self) -> None:
@@ -438,6 +562,8 @@ class File:
         if self.directory and self.directory.exists():
             shutil.rmtree(self.directory, ignore_errors=True)
         self.deleted = True
+        # Release the in-memory copy of the content, if any
+        self.__dict__.pop('data', None)
 
     @property
     def size(self) -> int:
@@ -445,14 +571,22 @@ class File:
         Return size of file content
         :return: file content size
         """
-        if not self._size and self.data:
-            self._size = self.data.getbuffer().nbytes
+        if not self._size and self.path.exists():
+            self._size = self.path.stat().st_size
         return self._size
 
     @size.setter
     def size(self, value: int):
         self._size = value
 
+    @cached_property
+    def suffix(self) -> str:
+        """
+        Lowercased extension of the file, so '.PDF' and '.pdf' are handled the same way.
+        :return (str): the extension, including the leading dot, or an empty string
+        """
+        return self.path.suffix.lower()
+
     @cached_property
     def type(self) -> str:
         """
@@ -460,16 +594,11 @@ class File:
         :return (str): file type or None if file is not reachable
         """
         # Guess type from mime-type
-        if self.mime_type in self.MIME_TYPE_EQUAL:
-            return self.MIME_TYPE_EQUAL[self.mime_type][0]
+        if p_type := self.MIME_TYPE_EQUAL.get(self.mime_type):
+            return p_type[0]
 
-        # Guess type from extension
-        for type_, extensions in self.TYPE_EXTENSIONS.items():
-            if self.path.suffix in extensions:
-                return type_
-
-        # Default type to BIN (??)
-        return 'BIN'
+        # Guess type from extension, default type to BIN (??)
+        return self._EXT_TO_TYPE.get(self.suffix, 'BIN')
 
     @cached_property
     def _extension_for_textract(self) -> Optional[str]:
@@ -478,13 +607,12 @@ class File:
         :return (str): file type or None if file is not reachable
         """
         # Guess extension from mime-type
-        for mime_type, p_type in self.MIME_TYPE_EQUAL.items():
-            if self.mime_type == mime_type:
-                return p_type[1]
+        if p_type := self.MIME_TYPE_EQUAL.get(self.mime_type):
+            return p_type[1]
 
         # Guess type from extension
-        if self.path.suffix:
-            return self.path.suffix
+        if self.suffix:
+            return self.suffix
 
         # Default extension to None
         return None
@@ -495,12 +623,20 @@ class File:
         Property to get file text content.
         :return: text content
         """
+        import textract  # type: ignore
+
         try:
             if self.is_html or self.is_eml or self.is_txt:
-                if self.data:
-                    return self.data.getvalue().decode(errors='replace')
+                if self.path.exists():
+                    return self.path.read_bytes().decode(errors='replace')
                 return ''
-            # Use of textract module for all file types
+            if self.is_pdf:
+                # PyMuPDF is already used for the previews, no need for a pdftotext subprocess
+                import fitz  # type: ignore
+
+                with fitz.open(self.path) as doc:
+                    return '\n'.join(page.get_text() for page in doc)
+            # Use of textract module for all other file types
             return textract.process(self.path, extension=self._extension_for_textract).decode(errors='replace')
 
         except textract.exceptions.ShellError:
@@ -598,6 +734,8 @@ class File:
     def eml_data(self) -> Optional[Dict]:
         if not self.is_eml:
             return None
+        from eml_parser import EmlParser
+
         ep = EmlParser(include_raw_body=True, include_attachment_data=True)
         return ep.decode_email(eml_file=self.path)
 
@@ -618,25 +756,13 @@ class File:
         Get file metadata.
         :return (dict): metadata
         """
-        metadata: Dict[str, str] = {}
         if not self.path.exists():
             return {}
-        exiftool_path = get_config('generic', 'exiftool_path')
-        if not exiftool_path or not Path(exiftool_path).exists():
-            exiftool_path = None
         try:
-            with exiftool.ExifToolHelper(executable=exiftool_path) as et:
-                for key, value in et.get_metadata([str(self.path)])[0].items():
-                    if any(key.lower().startswith(word) for word in ('sourcefile', 'exiftool:', 'file:')):
-                        continue
-                    key = key.split(':')[-1]
-                    key = re.sub(r"([A-Z]+)([A-Z][a-z])", r'\1 \2', key)
-                    key = re.sub(r"([a-z\d])([A-Z])", r'\1 \2', key)
-                    metadata[key] = value
+            return _clean_metadata(exiftool_get_metadata([self.path])[0])
         except Exception as e:
             self.logger.critical(f'Unable to use exiftool, probably because the version is too old: {e}')
-            metadata = {}
-        return metadata
+            return {}
 
     @property
     def icon(self) -> Optional[str]:
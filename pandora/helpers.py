@@ -3,16 +3,22 @@
 import logging
 import re
 
-from datetime import timedelta
 from enum import IntEnum, Enum, unique, auto
 from functools import lru_cache
 from importlib.metadata import version
+from pathlib import Path
 from typing import Dict, List, Optional, Union, Any
 
 from publicsuffix2 import PublicSuffixList, fetch  # type: ignore
 from pymispwarninglists import WarningLists
 import yaml
 
+try:
+    # Use libyaml when available, it is a lot faster
+    from yaml import CSafeLoader as SafeLoader
+except ImportError:
+    from yaml import SafeLoader  # type: ignore
+
 from .default import get_homedir
 from .exceptions import Unsupported
 from .role import Role
@@ -20,6 +26,15 @@ from .role import Role
 logger = logging.getLogger('Helpers')
 
 
+def _load_yaml(path: Path) -> Any:
+    with path.open() as f:
+        return yaml.load(f, Loader=SafeLoader)  # nosec B506
+
+
+_EXPIRE_RE = re.compile(r'(\d+)([smhd]?)')
+_EXPIRE_UNITS: Dict[str, int] = {'': 1, 's': 1, 'm': 60, 'h': 3600, 'd': 86400}
+
+
 # NOTE: Status code order for the UI: ALERT -> WARN -> CLEAN
 #       the keys in the enum must stay in this order
 @unique
@@ -51,15 +66,13 @@ class TypeObservable(Enum):
 
 @lru_cache(64)
 def allowlist_default() -> List[str]:
-    with (get_homedir() / 'config' / 'allowlist.yml').open() as config_file:
-        config = yaml.safe_load(config_file.read())
+    config = _load_yaml(get_homedir() / 'config' / 'allowlist.yml')
     return config['allowlist']
 
 
 @lru_cache(64)
 def roles_from_config() -> Dict[str, Role]:
-    with (get_homedir() / 'config' / 'roles.yml').open() as config_file:
-        config = yaml.safe_load(config_file.read())
+    config = _load_yaml(get_homedir() / 'config' / 'roles.yml')
     to_return = {}
     for r in config['roles']:
         actions = {key[4:]: value for key, value in r.items() if key.startswith('can_')}
@@ -77,22 +90,19 @@ def workers() -> Dict[str, Dict[str, Any]]:
         worker_default_config_file = workers_dir / 'base.yml.sample'
 
     # load default parameters
-    with worker_default_config_file.open() as f:
-        default_config = yaml.safe_load(f.read())
+    default_config = _load_yaml(worker_default_config_file)
 
     all_configs = {}
     # load all individual config files
     for configfile in workers_dir.glob('*.yml'):
         if configfile.name == 'base.yml':
             continue
-        with configfile.open() as f:
-            module_config = yaml.safe_load(f.read())
+        module_config = _load_yaml(configfile)
 
         # get the default config from the sample file, as a fallback
         module_config_sample = {}
         if (workers_dir / f'{configfile}.sample').exists():
-            with (workers_dir / f'{configfile}.sample').open() as f:
-                module_config_sample = yaml.safe_load(f.read())
+            module_config_sample = _load_yaml(workers_dir / f'{configfile}.sample')
 
         all_configs[configfile.stem] = {
             'meta': {**default_config['meta'], **module_config_sample['meta'], **module_config['meta']},
@@ -106,18 +116,18 @@ def workers() -> Dict[str, Dict[str, Any]]:
     return {name: all_configs[name] for name in sorted(all_configs)}
 
 
+_TRUE_VALUES = frozenset((True, 1, '1'))
+
+
 def make_bool(value: Optional[Union[bool, int, str]]) -> bool:
-    if value in [True, 1, '1']:
-        return True
-    return False
+    return value in _TRUE_VALUES
 
 
 def make_bool_for_redis(value: Optional[bool]) -> int:
-    if value is True:
-        return 1
-    return 0
+    return int(value is True)
 
 
+@lru_cache(256)
 def expire_in_sec(time: Union[str, int]) -> int:
     """
     Try to parse time value and return the amount of seconds.
@@ -126,18 +136,10 @@ def expire_in_sec(time: Union[str, int]) -> int:
     """
     if not time:
         return 0
-    t_match = re.fullmatch(r'(\d+)([smhd]?)', str(time))
+    t_match = _EXPIRE_RE.fullmatch(str(time))
     if t_match is None:
         raise Unsupported(f"impossible to parse cache '{time}'")
-    if not t_match.group(2) or t_match.group(2) == 's':
-        return int(timedelta(seconds=int(t_match.group(1))).total_seconds())
-    if t_match.group(2) == 'm':
-        return int(timedelta(minutes=int(t_match.group(1))).total_seconds())
-    if t_match.group(2) == 'h':
-        return int(timedelta(hours=int(t_match.group(1))).total_seconds())
-    if t_match.group(2) == 'd':
-        return int(timedelta(days=int(t_match.group(1))).total_seconds())
-    return 0
+    return int(t_match.group(1)) * _EXPIRE_UNITS[t_match.group(2)]
 
 
 @lru_cache(64)
@@ -100,7 +100,7 @@ class Pandora():
         """
         fields = {
             'task_uuid': task.uuid,
-            'disabled_workers': json.dumps(task.disabled_workers)
+            'disabled_workers': json.dumps(sorted(task.disabled_workers))
         }
         self.redis.xadd(name='tasks_queue', fields=fields, id='*',
                         maxlen=get_config('generic', 'tasks_max_len'))
@@ -122,13 +122,11 @@ class Pandora():
             first_date = first_date.timestamp()
         if isinstance(last_date, datetime):
             last_date = last_date.timestamp()
-        tasks = []
-        for task in self.storage.get_tasks(first_date=first_date, last_date=last_date):
-            # FIXME: get rid of that typing ignore
-            _task = Task(**task)  # type: ignore
-            if user.is_admin or (_task.user and user.get_id() == _task.user.get_id()):
-                tasks.append(_task)
-        return tasks
+        stored_tasks = self.storage.get_tasks(first_date=first_date, last_date=last_date)
+        if not user.is_admin:
+            # Filter on the stored user ID, only build the tasks the user can see
+            stored_tasks = [task for task in stored_tasks if task.get('user_id') == user.get_id()]
+        return Task.from_stored(stored_tasks)
 
     # ##############
 
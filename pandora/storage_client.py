@@ -3,7 +3,7 @@
 import operator
 
 from datetime import datetime
-from typing import Optional, Dict, List, Union, Set, overload
+from typing import Optional, Dict, Iterable, List, Union, Sequence, Set, overload
 
 from redis import ConnectionPool, Redis
 
@@ -21,27 +21,45 @@ class Storage():
                 host=get_config('generic', 'storage_db_hostname'),
                 port=get_config('generic', 'storage_db_port'),
                 decode_responses=True)
+            # The client is thread safe and the pool takes care of the forks, a single one is enough.
+            cls._redis_storage = Redis(connection_pool=cls._redis_pool_storage)
+            # HSET only if the hash exists, atomically: an expired or deleted task must not come back as a partial hash
+            cls._update_task_script = cls._redis_storage.register_script(
+                "if redis.call('EXISTS', KEYS[1]) == 0 then return 0 end "
+                "redis.call('HSET', KEYS[1], unpack(ARGV)) return 1")
         return cls._instance
 
     @property
     def storage(self):
-        return Redis(connection_pool=self._redis_pool_storage)
+        return self._redis_storage
+
+    def _hgetall_many(self, keys: Iterable[str]) -> List[Dict[str, str]]:
+        """Get many hashes in a single round-trip, missing keys are returned as empty dicts."""
+        pipeline = self.storage.pipeline(transaction=False)
+        for key in keys:
+            pipeline.hgetall(key)
+        return pipeline.execute()
 
     # #### User ####
 
     def get_user(self, user_id: str) -> Optional[Dict[str, str]]:
         return self.storage.hgetall(f'users:{user_id}')
 
+    def get_users_by_id(self, user_ids: Iterable[str]) -> List[Dict[str, str]]:
+        return self._hgetall_many(f'users:{user_id}' for user_id in user_ids)
+
     def set_user(self, user: Dict[str, str]) -> None:
-        self.storage.hmset(f'users:{user["session_id"]}', user)
-        self.storage.expire(f'users:{user["session_id"]}', get_config('generic', 'session_expire'))
-        self.storage.sadd('users', user["session_id"])
+        pipeline = self.storage.pipeline(transaction=False)
+        pipeline.hset(f'users:{user["session_id"]}', mapping=user)
+        pipeline.expire(f'users:{user["session_id"]}', get_config('generic', 'session_expire'))
+        pipeline.sadd('users', user["session_id"])
+        pipeline.execute()
 
     def get_users(self):
         users = []
         to_pop = []
-        for session_id in self.storage.smembers('users'):
-            user = self.storage.hgetall(f'users:{session_id}')
+        session_ids = list(self.storage.smembers('users'))
+        for session_id, user in zip(session_ids, self.get_users_by_id(session_ids)):
             if user:
                 users.append(user)
             else:
@@ -65,10 +83,7 @@ class Storage():
         return self.storage.hgetall(f'roles:{role_name}')
 
     def get_roles(self) -> List[Dict[str, str]]:
-        roles = []
-        for role_name in sorted(list(self.storage.smembers('roles'))):
-            roles.append(self.get_role(role_name))
-        return roles
+        return self._hgetall_many(f'roles:{role_name}' for role_name in sorted(self.storage.smembers('roles')))
 
     def set_role(self, role: Dict[str, str]) -> None:
         self.storage.hmset(f'roles:{role["name"]}', role)
@@ -104,12 +119,10 @@ class Storage():
         return self.storage.hgetall(f'observables:{identifier}')
 
     def get_task_observables(self, task_uuid: str) -> List[Dict[str, str]]:
-        observables = []
+        pipeline = self.storage.pipeline(transaction=False)
         for identifier in self.storage.smembers(f'{task_uuid}:observables'):
-            observable = self.get_observable(identifier=identifier)
-            if observable:
-                observables.append(observable)
-        return observables
+            pipeline.hgetall(f'observables:{identifier}')
+        return [observable for observable in pipeline.execute() if observable]
 
     def add_task_observable(self, task_uuid: str, sha256: str, observable_type: str):
         self.storage.sadd(f'{task_uuid}:observables', f'{sha256}-{observable_type}')
@@ -141,15 +154,15 @@ class Storage():
     def get_file(self, file_id: str) -> Dict[str, str]:
         return self.storage.hgetall(f'files:{file_id}')
 
+    def get_files_by_uuid(self, file_ids: Iterable[str]) -> List[Dict[str, str]]:
+        return self._hgetall_many(f'files:{file_id}' for file_id in file_ids)
+
     def set_file(self, file_details: Dict[str, Union[str, int]]):
         self.storage.hmset(f'files:{file_details["uuid"]}', file_details)
         self.storage.sadd('files', file_details["uuid"])
 
     def get_files(self) -> List[Dict[str, str]]:
-        files = []
-        for uuid in self.storage.smembers('files'):
-            files.append(self.get_file(uuid))
-        return files
+        return self.get_files_by_uuid(self.storage.smembers('files'))
 
     # ##############
 
@@ -158,15 +171,22 @@ class Storage():
     def get_task(self, task_id: str) -> Dict[str, str]:
         return self.storage.hgetall(f'tasks:{task_id}')
 
+    def get_tasks_by_uuid(self, task_ids: Iterable[str]) -> List[Dict[str, str]]:
+        return self._hgetall_many(f'tasks:{task_id}' for task_id in task_ids)
+
     def set_task(self, task: Dict[str, str]):
         timestamp = datetime.fromisoformat(task['save_date']).timestamp()
         self.storage.hmset(f'tasks:{task["uuid"]}', task)
         self.storage.zadd('tasks', {task["uuid"]: timestamp})
 
+    def update_task(self, task_uuid: str, fields: Dict[str, str]) -> bool:
+        """Only write some fields of an existing task. Returns False if the task is not in the storage anymore."""
+        args = [item for field in fields.items() for item in field]
+        return bool(self._update_task_script(keys=[f'tasks:{task_uuid}'], args=args))
+
     def get_tasks(self, *, first_date: Union[str, float]=0, last_date: Union[str, float]='+Inf') -> List[Dict[str, str]]:
-        tasks = []
-        for uuid in self.storage.zrevrangebyscore('tasks', min=first_date, max=last_date):
-            tasks.append(self.get_task(uuid))
+        # Expired tasks are still in the index, skip them
+        tasks = [task for task in self.get_tasks_by_uuid(self.storage.zrevrangebyscore('tasks', min=first_date, max=last_date)) if task]
         tasks.sort(key=operator.itemgetter('save_date'), reverse=True)
         return tasks
 
@@ -186,5 +206,19 @@ class Storage():
     def get_report(self, task_uuid: str, worker_name: str) -> Dict[str, str]:
         return self.storage.hgetall(f'reports:{task_uuid}-{worker_name}')
 
+    def get_reports(self, task_uuid: str, worker_names: Sequence[str]) -> Dict[str, Dict[str, str]]:
+        """Get the reports of a task for a list of workers, in a single round-trip."""
+        pipeline = self.storage.pipeline(transaction=False)
+        for worker_name in worker_names:
+            pipeline.hgetall(f'reports:{task_uuid}-{worker_name}')
+        return dict(zip(worker_names, pipeline.execute()))
+
+    def get_reports_status(self, task_uuid: str, worker_names: Sequence[str]) -> Dict[str, Optional[str]]:
+        """Get only the status of the reports of a task, in a single round-trip."""
+        pipeline = self.storage.pipeline(transaction=False)
+        for worker_name in worker_names:
+            pipeline.hget(f'reports:{task_uuid}-{worker_name}', 'status')
+        return dict(zip(worker_names, pipeline.execute()))
+
     def set_report(self, report: Dict[str, str]):
         self.storage.hmset(f'reports:{report["task_uuid"]}-{report["worker_name"]}', report)
@@ -1,8 +1,8 @@
 import json
 
 from datetime import datetime, timedelta, timezone
-from io import BytesIO
-from typing import Dict, Any, Optional, List, overload, Tuple
+from functools import cached_property
+from typing import Dict, Any, BinaryIO, FrozenSet, Iterable, Optional, List, overload, Tuple
 from uuid import uuid4
 
 from pymisp import MISPEvent, MISPAttribute
@@ -25,30 +25,61 @@ class Task:
     _parent: Optional['Task']
 
     @classmethod
-    def new_task(cls, user: User, sample: BytesIO, filename: str, disabled_workers: List[str],
+    def new_task(cls, user: User, sample: BinaryIO, filename: str, disabled_workers: Iterable[str],
                  parent: Optional['Task']=None, password: Optional[str]=None) -> 'Task':
         task_uuid = str(uuid4())
         today = datetime.now(timezone.utc)
         directory = get_homedir() / 'tasks' / str(today.year) / f'{today.month:02}' / task_uuid
         safe_create_dir(directory)
         filepath = directory / secure_filename(filename)
-        with filepath.open('wb') as _f:
-            _f.write(sample.getvalue())
-
-        file = File.new_file(filepath, filename=filename)
+        file = File.from_stream(sample, filepath, filename=filename)
 
         task = cls(uuid=task_uuid, submitted_file=file, disabled_workers=disabled_workers,
                    user=user, parent=parent, password=password)
         task.store(force=True)
         return task
 
+    @classmethod
+    def load_many(cls, task_ids: Iterable[str]) -> List['Task']:
+        """
+        Load a list of tasks with their files and users, in two round-trips to the storage.
+        Unknown tasks are skipped.
+        :param task_ids: UUIDs of the tasks
+        """
+        return cls.from_stored([task for task in Storage().get_tasks_by_uuid(task_ids) if task])
+
+    @classmethod
+    def from_stored(cls, tasks: List[Dict[str, str]]) -> List['Task']:
+        """
+        Build tasks from their stored details, the files and the users are loaded with one pipeline each.
+        :param tasks: the tasks, as returned by the storage
+        """
+        storage = Storage()
+        user_ids = {task['user_id'] for task in tasks if task.get('user_id')}
+        files = {f['uuid']: f for f in storage.get_files_by_uuid(task['file_id'] for task in tasks) if f}
+        users = {u['session_id']: u for u in storage.get_users_by_id(user_ids) if u}
+        to_return = []
+        for task in tasks:
+            # The ids are kept along with the objects, the task knows what is in the storage
+            kwargs: Dict[str, Any] = dict(task)
+            if stored_file := files.get(task['file_id']):
+                kwargs['submitted_file'] = File(**stored_file)
+            if stored_user := users.get(task.get('user_id', '')):
+                kwargs['user'] = User(**stored_user)
+            _task = cls(**kwargs)
+            if hasattr(_task, '_file'):
+                # The file is loaded, computing the status is cheap: keep the stored one up to date
+                _task.store()
+            to_return.append(_task)
+        return to_return
+
     @overload
     def __init__(self, uuid: str, submitted_file: File,
                  user: User,
                  parent: Optional['Task']=None,
                  status: Optional[Status]=None,
                  done: bool=False,
-                 disabled_workers: Optional[List[str]]=None,
+                 disabled_workers: Optional[Iterable[str]]=None,
                  password: Optional[str]=None):
         '''With python classes'''
         ...
@@ -94,8 +125,12 @@ class Task:
             self.file = submitted_file
             self.save_date = self.file.save_date
         elif file_id:
+            # The file is loaded on demand, most callers only need the status of the task.
             self._file_id = file_id
-            self.save_date = self.file.save_date
+            if save_date:
+                self.save_date = datetime.fromisoformat(save_date).astimezone(timezone.utc)
+            else:
+                self.save_date = self.file.save_date
         else:
             self.save_date = save_date
 
@@ -112,23 +147,40 @@ class Task:
         if isinstance(status, Status):
             self._status = status
         elif isinstance(status, str):
-            self._status = Status[status]
+            # Unknown values (old or corrupted entries) are considered as not started
+            self._status = Status.__members__.get(status, Status.WAITING)
         else:
             self._status = Status.WAITING
         self.done = done
         self.linked_tasks = None
+        self.disabled_workers: FrozenSet[str]
         if disabled_workers:
             if isinstance(disabled_workers, str):
-                self.disabled_workers = json.loads(disabled_workers)
+                self.disabled_workers = frozenset(json.loads(disabled_workers))
             else:
-                self.disabled_workers = disabled_workers
+                self.disabled_workers = frozenset(disabled_workers)
         else:
-            self.disabled_workers = []
+            self.disabled_workers = frozenset()
+        # The workers list is cached and the disabled workers don't change after the task is created
+        self._active_workers: Tuple[str, ...] = tuple(worker_name for worker_name in workers()
+                                                      if worker_name not in self.disabled_workers)
         if password:
             self.password = password
         else:
             self.password = ''  # nosec B105
-        self.store()
+
+        # What is currently in the storage, to only write the fields that changed
+        self._stored: Dict[str, str] = {}
+        if file_id:
+            # Loaded from redis
+            self._stored = {k: v for k, v in {
+                'uuid': uuid, 'parent_id': parent_id, 'file_id': file_id, 'user_id': user_id,
+                'disabled_workers': disabled_workers, 'password': password, 'status': status,
+                'save_date': save_date}.items() if v is not None}
+        else:
+            # Storing a task loaded from storage needs its status, and the status needs the file.
+            # The callers that have the file at hand store it themselves (see from_stored).
+            self.store()
 
     @property
     def user(self) -> Optional[User]:
@@ -143,6 +195,7 @@ class Task:
     @user.setter
     def user(self, u: User) -> None:
         self._user = u
+        self.__dict__.pop('_static_dict', None)
 
     @property
     def file(self) -> File:
@@ -157,6 +210,7 @@ class Task:
     @file.setter
     def file(self, f: File) -> None:
         self._file = f
+        self.__dict__.pop('_static_dict', None)
 
     @property
     def parent(self) -> Optional['Task']:
@@ -171,65 +225,71 @@ class Task:
     @parent.setter
     def parent(self, parent: 'Task'):
         self._parent = parent
+        self.__dict__.pop('_static_dict', None)
 
     @property
     def extracted(self) -> List['Task']:
-        to_return = []
-        for t_uuid in self.storage.get_extracted_references(self.uuid):
-            extract = self.storage.get_task(t_uuid)
-            if not extract:
-                continue
-            to_return.append(Task(**extract))  # type: ignore
-        return to_return
+        return self.load_many(self.storage.get_extracted_references(self.uuid))
 
-    @property
-    def to_dict(self) -> Dict[str, Any]:
+    @cached_property
+    def _static_dict(self) -> Dict[str, Any]:
+        '''The part of to_dict that doesn't change during the life of the task. Reset by the setters.'''
         return {k: v for k, v in {
             'uuid': self.uuid,
-            'parent_id': self.parent.uuid if self.parent else None,
-            'file_id': self.file.uuid,
-            'user_id': self.user.get_id() if self.user else None,
-            'disabled_workers': json.dumps(self.disabled_workers) if hasattr(self, 'disabled_workers') else None,
+            # Use the known ids, no need to load the parent, the file or the user to get them
+            'parent_id': self._parent.uuid if getattr(self, '_parent', None) else getattr(self, '_parent_id', None),
+            'file_id': self._file.uuid if hasattr(self, '_file') else self._file_id,
+            'user_id': self._user.get_id() if getattr(self, '_user', None) else getattr(self, '_user_id', None),
+            'disabled_workers': json.dumps(sorted(self.disabled_workers)) if hasattr(self, 'disabled_workers') else None,
             'password': self.password if self.password else None,
-            'status': self.status.name,
             'save_date': self.save_date.isoformat()
         }.items() if v is not None}
 
+    @property
+    def to_dict(self) -> Dict[str, Any]:
+        return {**self._static_dict, 'status': self.status.name}
+
     def store(self, force: bool=False):
         if force or (self.workers_done and self.status not in [Status.WAITING, Status.RUNNING]):
-            self.storage.set_task(self.to_dict)
+            to_store = self.to_dict
+            if not self._stored:
+                self.storage.set_task(to_store)
+            elif changed := {k: v for k, v in to_store.items() if self._stored.get(k) != v}:
+                if not self.storage.update_task(self.uuid, changed):
+                    # The task expired or was deleted in the meantime, write the whole record again
+                    self.storage.set_task(to_store)
+            self._stored = to_store
 
     @property
     def reports(self) -> Dict[str, Report]:
-        to_return: Dict[str, Report] = {}
-        for worker_name in workers():
-            if worker_name in self.disabled_workers:
-                continue
-            stored_report = self.storage.get_report(task_uuid=self.uuid, worker_name=worker_name)
-            if stored_report:
-                report = Report(**stored_report)
-            else:
-                report = Report(self.uuid, worker_name)
-            to_return[worker_name] = report
-        return to_return
+        stored_reports = self.storage.get_reports(task_uuid=self.uuid, worker_names=self._active_workers)
+        return {worker_name: Report(**stored_report) if stored_report else Report(self.uuid, worker_name)
+                for worker_name, stored_report in stored_reports.items()}
 
     @property
-    def workers_done(self) -> bool:
+    def _reports_status(self) -> Dict[str, Status]:
+        """Status of the reports, without loading the reports themselves."""
+        # Like the task status, unknown values (old or corrupted entries) are considered as not started
+        return {worker_name: Status.__members__.get(status, Status.WAITING) if status else Status.WAITING
+                for worker_name, status in self.storage.get_reports_status(self.uuid, self._active_workers).items()}
+
+    def _workers_done(self, reports_status: Optional[Dict[str, Status]]=None) -> bool:
         if self.save_date <= datetime.now(timezone.utc) - timedelta(hours=1):
             # NOTE Failsafe. If the task was started more than 1h ago, it is
             # either done, or it failed.
             return True
-        for _, report in self.reports.items():
-            if not report.is_done:
-                return False
-        return True
+        if reports_status is None:
+            reports_status = self._reports_status
+        return all(status not in (Status.WAITING, Status.RUNNING) for status in reports_status.values())
+
+    @property
+    def workers_done(self) -> bool:
+        return self._workers_done()
 
     @property
     def workers_status(self) -> Dict[str, Tuple[bool, str]]:
-        to_return: Dict[str, Tuple[bool, str]] = {}
-        for report_name, report in self.reports.items():
-            to_return[report_name] = (report.is_done, report.status.name)
-        return to_return
+        return {worker_name: (status not in (Status.WAITING, Status.RUNNING), status.name)
+                for worker_name, status in self._reports_status.items()}
 
     @property
     def status(self) -> Status:
@@ -240,18 +300,19 @@ class Task:
             # If the status was set to any of these values, the reports finished
             return self._status
 
-        if self.workers_done:
+        reports_status = self._reports_status
+        if self._workers_done(reports_status):
             if self._status < Status.CLEAN:
                 self._status = Status.CLEAN
             # All the workers are done, return success/error
-            for _, report in self.reports.items():
+            for report_status in reports_status.values():
                 # Status code order: ALERT - WARN - CLEAN - ERROR
                 # NOTE: when a report is Status.DISABLED or Status.NOTAPPLICABLE,
                 #       it has no impact on the general status of the task
-                if report.status in [Status.DISABLED, Status.NOTAPPLICABLE]:
+                if report_status in [Status.DISABLED, Status.NOTAPPLICABLE]:
                     continue
-                if report.status > self._status:
-                    self._status = report.status
+                if report_status > self._status:
+                    self._status = report_status
         else:
             # At least one worker isn't done yet
             self._status = Status.WAITING
@@ -22,6 +22,15 @@ class TextParser:
         r'[\+][0-9]{3}(([a-zA-Z0-9]{1,4}[\+]?){0,4})[\+]))'
     ])
 
+    # Compiled once, when the class is created
+    _URL_PATTERN = re.compile(URL_REGEX, re.VERBOSE)
+    _URL_SIMPLE_PATTERN = re.compile(URL_REGEX_SIMPLE, re.VERBOSE)
+    _HOSTNAME_PATTERN = re.compile(HOSTNAME_REGEX)
+    _EMAIL_PATTERN = re.compile(EMAIL_REGEX)
+    _IP_PATTERN = re.compile(IP_REGEX)
+    _IBAN_PATTERN = re.compile(IBAN_REGEX)
+    _IBAN_SEPARATOR_PATTERN = re.compile(r'\s\+')
+
     def __init__(self, text):
         self.tlds = get_public_suffix_list().tlds
         self.text = str(text) or ''
@@ -34,23 +43,21 @@ class TextParser:
     def _find_ips(self):
         ips = set()
         text = self.text.replace('[.]', '.')
-        for match in re.finditer(self.IP_REGEX, text):
+        for match in self._IP_PATTERN.finditer(text):
             ips.add(match.group(1))
         return ips
 
     def _find_ibans(self):
         ibans = set()
-        for match in re.finditer(self.IBAN_REGEX, self.text):
-            ibans.add(re.sub(r'\s\+', '', match.group(1)))
+        for match in self._IBAN_PATTERN.finditer(self.text):
+            ibans.add(self._IBAN_SEPARATOR_PATTERN.sub('', match.group(1)))
         return ibans
 
     def _find_urls(self):
         urls = set()
-        simple_pattern = re.compile(self.URL_REGEX_SIMPLE, re.VERBOSE)
-        complex_pattern = re.compile(self.URL_REGEX, re.VERBOSE)
-        for match in re.finditer(simple_pattern, self.text):
+        for match in self._URL_SIMPLE_PATTERN.finditer(self.text):
             url = match.group(1)
-            if complex_pattern.match(url):
+            if self._URL_PATTERN.match(url):
                 # Remove ","
                 if "," in url:
                     url = url.split(',')[0]
@@ -67,7 +74,7 @@ class TextParser:
     def _find_hostnames(self):
         hostnames = set()
         text = self.text.replace("[.]", ".")
-        for match in re.finditer(self.HOSTNAME_REGEX, text):
+        for match in self._HOSTNAME_PATTERN.finditer(text):
             hostname = match.group(1).lower()
             tld = hostname.split('.')[-1]
             if tld in self.tlds:
@@ -78,6 +85,6 @@ class TextParser:
         emails = set()
         # Replace [a] with @
         text = self.text.replace("[a]", "@")
-        for match in re.finditer(self.EMAIL_REGEX, text):
+        for match in self._EMAIL_PATTERN.finditer(text):
             emails.add(match.group(1))
         return emails
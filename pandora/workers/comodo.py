@@ -11,6 +11,9 @@ from ..report import Report
 
 from .base import BaseWorker
 
+# Applied on each line of the output: no greedy groups competing for the same characters.
+_COMODO_RE = re.compile(rb'(?P<file>[^\r\n]*?) ---> Found [^\r\n]*?, Malware Name is (?P<name>[^\r\n]+)', re.IGNORECASE)
+
 
 class ComodoWorker(BaseWorker):
 
@@ -21,17 +24,30 @@ class ComodoWorker(BaseWorker):
                  loglevel: int=logging.INFO, **options):
         super().__init__(module, worker_id, cache, timeout, loglevel, **options)
 
+        # A single check per file, and it also catches a scanner that exists but cannot be executed
         if (not self.comodo_path
-                or not os.path.exists(self.comodo_path)
-                or not os.path.exists(self.comodo_bases)):
+                or not os.access(self.comodo_path, os.X_OK)
+                or not os.path.isfile(self.comodo_bases)):
             self.disabled = True
             return
 
     def analyse(self, task: Task, report: Report, manual_trigger: bool=False):
         self.logger.debug(f'analysing file {task.file.path}...')
         args = [self.comodo_path, '-v', '-s', str(task.file.path)]
-        process = subprocess.run(args, capture_output=True, timeout=self.timeout, check=False)
-        reg = re.compile('(?P<file>.*) ---> Found .*, Malware Name is (?P<name>.*)', re.IGNORECASE)
-        for i in reg.finditer(process.stdout.decode()):
-            report.status = Status.ALERT
-            report.add_details('malicious', i.group(2))
+        # Only stdout is parsed, don't buffer stderr for nothing.
+        # The output is parsed line by line as it comes, the timeout is enforced by the worker (SIGALRM).
+        with subprocess.Popen(args, stdout=subprocess.PIPE, stderr=subprocess.DEVNULL) as process:
+            try:
+                for line in process.stdout:  # type: ignore[union-attr]
+                    # Most lines are not detections, skip them without running the pattern
+                    if b' ---> found ' not in line.lower():
+                        continue
+                    if i := _COMODO_RE.match(line):
+                        report.status = Status.ALERT
+                        report.add_details('malicious', i.group('name').decode(errors='replace'))
+            except BaseException:
+                # Timeout or unexpected error, do not leave the scanner running
+                process.kill()
+                raise
+            # stdout is closed, let the scanner exit on its own
+            process.wait()
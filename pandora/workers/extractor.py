@@ -1,16 +1,22 @@
 import logging
+import os
+import posixpath
 import zipfile
 import base64
 import shutil
+import tarfile
+import threading
 import time
-from tarfile import TarFile
+import zlib
+from concurrent.futures import ThreadPoolExecutor
 
 from bz2 import BZ2File
 from gzip import GzipFile
 from lzma import LZMAFile
-from io import BytesIO
+from io import BufferedIOBase, BytesIO
 from pathlib import Path
-from typing import List, Optional, Union
+from typing import Callable, Dict, List, Optional, Tuple, Union
+from uuid import uuid4
 
 import py7zr  # type: ignore
 import pycdlib
@@ -56,14 +62,39 @@ class Extractor(BaseWorker):
     max_extracted_filesize_in_mb: int
     max_is_error: bool
     zip_passwords: List[str]
+    # Read the decompressed streams (bz2, gz, lzma) by chunks of that size
+    decompress_chunk_size: int = 256 * 1024
 
     def __init__(self, module: str, worker_id: int, cache: str, timeout: str,
                  loglevel: int=logging.INFO, **options):
         super().__init__(module, worker_id, cache, timeout, loglevel, **options)
         self.max_extracted_filesize = self.max_extracted_filesize_in_mb * 1000000
+        # Status of the report when a limit is reached
+        self._limit_status = Status.ERROR if self.max_is_error else Status.ALERT
 
         # We might be getting integers from the config file
         self.zip_passwords = [str(pwd) for pwd in self.zip_passwords]
+        # Started on first use, in the worker process
+        self._cleanup_executor: Optional[ThreadPoolExecutor] = None
+
+    def _cleanup(self, directory: Path) -> None:
+        """
+        Delete a directory in a background thread, the worker doesn't have to wait for it.
+        It is renamed first, so it is out of the way right away.
+        """
+        if self._cleanup_executor is None:
+            self._cleanup_executor = ThreadPoolExecutor(max_workers=1)
+        to_delete = directory.with_name(f'.{directory.name}-{uuid4()}')
+        directory.rename(to_delete)
+        self._cleanup_executor.submit(shutil.rmtree, to_delete, ignore_errors=True)
+
+    def _report_limit(self, report: Report, message: str) -> None:
+        """
+        One of the limits (size, number of files) was reached.
+        """
+        self.logger.warning(message)
+        report.status = self._limit_status
+        report.add_details('Warning', message)
 
     @property
     def passwords(self):
@@ -77,9 +108,10 @@ class Extractor(BaseWorker):
         iso = pycdlib.PyCdlib()
         extracted_files: List[Path] = []
         try:
-            if not archive_file.data:
+            if not archive_file.path.exists():
                 return extracted_files
-            iso.open_fp(archive_file.data)
+            # pycdlib reads what it needs from the file, no need to load the whole image in memory
+            iso.open(str(archive_file.path))
             facade: Union[PyCdlibJoliet, PyCdlibUDF, PyCdlibRockRidge, PyCdlibISO9660]
             if iso.has_udf():
                 facade = iso.get_udf_facade()
@@ -89,32 +121,36 @@ class Extractor(BaseWorker):
                 facade = iso.get_rock_ridge_facade()
             else:
                 facade = iso.get_iso9660_facade()
+            # List the members first, the sizes are in the directory records.
+            to_extract: List[Tuple[str, str, str]] = []
+            too_many_files = False
             for dirname, _, filelist in facade.walk('/'):
-                if len(extracted_files) > self.max_files_in_archive:
-                    break
-                if not filelist:
-                    continue
                 for filename in filelist:
                     filename = filename.lstrip('/')
-                    extracted = BytesIO()
-                    facade.get_file_from_iso_fp(extracted, f'{dirname}/{filename}')
-                    if extracted.getbuffer().nbytes >= self.max_extracted_filesize:
-                        self.logger.warning(f'File {archive_file.path.name} too big ({extracted.getbuffer().nbytes}).')
-                        report.status = Status.ERROR if self.max_is_error else Status.ALERT
-                        report.add_details('Warning', f'File {archive_file.path.name} too big ({extracted.getbuffer().nbytes}).')
+                    iso_path = posixpath.join(dirname, filename)
+                    file_size = facade.get_record(iso_path).get_data_length()
+                    if file_size >= self.max_extracted_filesize:
+                        self._report_limit(report, f'File {archive_file.path.name} too big ({file_size}).')
                         continue
-                    if len(extracted_files) > self.max_files_in_archive:
+                    if len(to_extract) >= self.max_files_in_archive:
+                        too_many_files = True
                         break
-                    tmp_dest_dir = dest_dir / f'.{dirname}'
-                    safe_create_dir(tmp_dest_dir)
-                    filepath = tmp_dest_dir / filename
-                    with filepath.open('wb') as f:
-                        f.write(extracted.getvalue())
-                    extracted_files.append(filepath)
-            if len(extracted_files) > self.max_files_in_archive:
-                self.logger.warning(f'Too many files in the archive (more than {self.max_files_in_archive}).')
-                report.status = Status.ERROR if self.max_is_error else Status.ALERT
-                report.add_details('Warning', f'Too many files in the archive (more than {self.max_files_in_archive}).')
+                    to_extract.append((dirname, filename, iso_path))
+                if too_many_files:
+                    break
+            if too_many_files:
+                self._report_limit(report, f'Too many files in the archive (more than {self.max_files_in_archive}).')
+
+            # NOTE: pycdlib reads from a single file handle, the extraction cannot be parallelized.
+            created_dirs: Dict[str, Path] = {}
+            for dirname, filename, iso_path in to_extract:
+                if dirname not in created_dirs:
+                    created_dirs[dirname] = dest_dir / f'.{dirname}'
+                    safe_create_dir(created_dirs[dirname])
+                filepath = created_dirs[dirname] / filename
+                with filepath.open('wb') as f:
+                    facade.get_file_from_iso_fp(f, iso_path)
+                extracted_files.append(filepath)
         finally:
             try:
                 iso.close()
@@ -122,26 +158,74 @@ class Extractor(BaseWorker):
                 pass
         return extracted_files
 
-    def _extract_zip(self, archive_file: File, report: Report, dest_dir: Path, zip_reader=zipfile.ZipFile) -> List[Path]:
+    def _extract_zip_members(self, archive_file: File, members: List[zipfile.ZipInfo], dest_dir: Path,
+                             zip_reader, password: Optional[bytes]) -> List[Path]:
+        """
+        Extract members of a zip file in parallel: zlib (and the AES module used by pyzipper) release the GIL.
+        Each thread has its own handle on the archive, ZipFile objects cannot be shared between threads.
+        """
+        local = threading.local()
+        handles = []
+
+        def _extract(info: zipfile.ZipInfo) -> Path:
+            if not hasattr(local, 'archive'):
+                local.archive = zip_reader(str(archive_file.path))
+                if password:
+                    local.archive.setpassword(password)
+                handles.append(local.archive)
+            try:
+                return Path(local.archive.extract(info, dest_dir))
+            except FileExistsError:
+                # Another thread created the same parent directory at the same time, try again.
+                return Path(local.archive.extract(info, dest_dir))
+
+        try:
+            with ThreadPoolExecutor(max_workers=min(len(members), os.cpu_count() or 1)) as executor:
+                # On error or timeout, the iterator returned by map cancels the extractions that are not started yet
+                return list(executor.map(_extract, members))
+        finally:
+            for handle in handles:
+                handle.close()
+
+    def _zip_reader(self, archive_file: File):
+        """
+        Pick the reader for a zip file: the standard library does not support WinZip AES encryption.
+        AES encrypted members use the compression method 99, it is in the central directory.
+        """
+        with zipfile.ZipFile(str(archive_file.path)) as archive:
+            if any(info.compress_type == 99 for info in archive.infolist()):
+                return pyzipper.AESZipFile
+        return zipfile.ZipFile
+
+    def _extract_zip(self, archive_file: File, report: Report, dest_dir: Path) -> List[Path]:
         found_password = False
+        zip_reader = self._zip_reader(archive_file)
         extracted_files: List[Path] = []
+        # Members to extract, after checking the limits and the password
+        to_extract: List[zipfile.ZipInfo] = []
+        password: Optional[bytes] = None
         with zip_reader(str(archive_file.path)) as archive:
-            for file_number, info in enumerate(archive.infolist()):
+            infos = archive.infolist()
+            for file_number, info in enumerate(infos):
                 if file_number >= self.max_files_in_archive:
-                    warning_msg = f'Too many files ({len(archive.infolist())}) in the archive, stopping at {self.max_files_in_archive}.'
-                    self.logger.warning(warning_msg)
-                    report.status = Status.ERROR if self.max_is_error else Status.ALERT
-                    report.add_details('Warning', warning_msg)
+                    self._report_limit(report, f'Too many files ({len(infos)}) in the archive, stopping at {self.max_files_in_archive}.')
                     break
                 is_encrypted = info.flag_bits & 0x1  # from https://github.com/python/cpython/blob/3.10/Lib/zipfile.py
                 if is_encrypted and not found_password:
                     for pwd in self.passwords:
                         try:
+                            # Opening the member checks the password against the verifier in the encryption header,
+                            # it rejects most of the wrong passwords without decompressing anything.
+                            with archive.open(info, pwd=pwd.encode()):
+                                pass
+                            # The ZipCrypto verifier is a single byte, a wrong password passes it 1 time in 256.
+                            # Only the CRC check at the end of a full read is a proof.
                             archive.read(info, pwd=pwd.encode())
-                            archive.setpassword(pwd.encode())
+                            password = pwd.encode()
+                            archive.setpassword(password)
                             found_password = True
                             break
-                        except RuntimeError:
+                        except (RuntimeError, zlib.error, zipfile.BadZipFile):
                             continue
                     else:
                         report.status = Status.WARN
@@ -151,34 +235,38 @@ class Extractor(BaseWorker):
                 if info.is_dir():
                     continue
                 if info.file_size > self.max_extracted_filesize:
-                    warning_msg = f'Skipping file {info.filename}, too big ({info.file_size}).'
-                    self.logger.warning(warning_msg)
-                    report.status = Status.ERROR if self.max_is_error else Status.ALERT
-                    report.add_details('Warning', warning_msg)
+                    self._report_limit(report, f'Skipping file {info.filename}, too big ({info.file_size}).')
                     continue
-                file_path = archive.extract(info, dest_dir)
-                extracted_files.append(Path(file_path))
+                to_extract.append(info)
             else:
                 # was able to extract everything, except files that are too big.
                 if report.status == Status.RUNNING:
                     report.status = Status.CLEAN
-        return extracted_files
+            # A zip can have many members with the same name, they would be written to the same file concurrently.
+            # Keep the last one, like a sequential extraction. The key is the path zipfile extracts the member to.
+            to_extract = list({tuple(part for part in info.filename.split('/') if part not in ('', '.', '..')): info
+                               for info in to_extract}.values())
+            if len(to_extract) <= 1:
+                # Not worth starting threads
+                for info in to_extract:
+                    extracted_files.append(Path(archive.extract(info, dest_dir)))
+                return extracted_files
+        return self._extract_zip_members(archive_file, to_extract, dest_dir, zip_reader, password)
 
     def _extract_rar(self, archive_file: File, report: Report, dest_dir: Path) -> List[Path]:
         found_password = False
         extracted_files: List[Path] = []
         with rarfile.RarFile(archive_file.path) as archive:
-            if not archive.infolist():
+            infos = archive.infolist()
+            if not infos:
                 # Looks like there are no files in the archive, this is suspicious
                 # Also, might be a REV file, which is potentially not supported
                 self.logger.warning(f'Looks like the archive {archive_file.path} is empty.')
                 # NOTE: There is a catchall for that.
 
-            for file_number, info in enumerate(archive.infolist()):
+            for file_number, info in enumerate(infos):
                 if file_number >= self.max_files_in_archive:
-                    self.logger.warning(f'Too many files ({file_number}/{self.max_files_in_archive}) in the archive, stop extracting.')
-                    report.status = Status.ERROR if self.max_is_error else Status.ALERT
-                    report.add_details('Warning', f'Too many files ({file_number}/{self.max_files_in_archive}) in the archive')
+                    self._report_limit(report, f'Too many files ({file_number}/{self.max_files_in_archive}) in the archive')
                     break
                 if info.needs_password() and not found_password:
                     for pwd in self.passwords:
@@ -200,9 +288,7 @@ class Extractor(BaseWorker):
                 if info.is_dir():
                     continue
                 if info.file_size > self.max_extracted_filesize:
-                    self.logger.warning(f'Skipping file {info.filename}, too big ({info.file_size}).')
-                    report.status = Status.ERROR if self.max_is_error else Status.ALERT
-                    report.add_details('Warning', f'Skipping file {info.filename}, too big ({info.file_size}).')
+                    self._report_limit(report, f'Skipping file {info.filename}, too big ({info.file_size}).')
                     continue
                 file_path = archive.extract(info, dest_dir)
                 extracted_files.append(Path(file_path))
@@ -229,14 +315,16 @@ class Extractor(BaseWorker):
 
     def _extract_7z(self, archive_file: File, report: Report, dest_dir: Path) -> List[Path]:
         # 7z can be encrypted at 2 places, headers, or files. if headers, we have to try.
-        needs_password = False
         try:
-            with py7zr.SevenZipFile(file=archive_file.path, mode='r') as archive:
-                files_in_archive = archive.getnames()
-                if files_in_archive:
-                    archive.read(files_in_archive[0])
+            archive = py7zr.SevenZipFile(file=archive_file.path, mode='r')
         except py7zr.exceptions.PasswordRequired:
+            # Encrypted headers
             needs_password = True
+        else:
+            # Encrypted files, the headers tell us without decompressing anything
+            needs_password = archive.needs_password()
+            if needs_password:
+                archive.close()
 
         if needs_password:
             password = self._try_password_7z(archive_file.path)
@@ -245,101 +333,88 @@ class Extractor(BaseWorker):
                 report.add_details('Warning', 'Encrypted archive, unable to find password')
                 report.add_extra('no_password', True)
                 return []
-        else:
-            password = None
+            archive = py7zr.SevenZipFile(file=archive_file.path, mode='r', password=password)
 
-        with py7zr.SevenZipFile(file=archive_file.path, mode='r', password=password) as archive:
-            if archive.archiveinfo().uncompressed >= self.max_extracted_filesize:
-                self.logger.warning(f'File {archive_file.path.name} too big ({archive.archiveinfo().uncompressed}).')
-                report.status = Status.ERROR if self.max_is_error else Status.ALERT
-                report.add_details('Warning', f'File {archive_file.path.name} too big ({archive.archiveinfo().uncompressed}).')
+        with archive:
+            uncompressed = archive.archiveinfo().uncompressed
+            if uncompressed >= self.max_extracted_filesize:
+                self._report_limit(report, f'File {archive_file.path.name} too big ({uncompressed}).')
                 return []
 
-            if len(archive.getnames()) > self.max_files_in_archive:
-                self.logger.warning(f'Too many files ({len(archive.getnames())}/{self.max_files_in_archive}) in the archive.')
-                report.status = Status.ERROR if self.max_is_error else Status.ALERT
-                report.add_details('Warning', f'Too many files ({len(archive.getnames())}/{self.max_files_in_archive}) in the archive')
+            nb_files = len(archive.getnames())
+            if nb_files > self.max_files_in_archive:
+                self._report_limit(report, f'Too many files ({nb_files}/{self.max_files_in_archive}) in the archive')
                 return []
 
             archive.extractall(path=str(dest_dir))
 
-        return [path for path in dest_dir.iterdir() if path.is_file()]
+        # The entries returned by scandir know their type, no need to stat them again
+        with os.scandir(dest_dir) as entries:
+            return [Path(entry.path) for entry in entries if entry.is_file(follow_symlinks=False)]
 
-    def _extract_bz2(self, archive_file: File, report: Report, dest_dir: Path) -> List[Path]:
-        # bz2 is a TAR archive, we basically need to unzip it and then extract the files from the TAR
-        # No password can be used to protect a bz2, so we don't need to check for passwords this time
-        # Sometimes the bz2 won't contain a TAR, but the way to unzip bz2 stays the same either way
-        bz2file = BZ2File(archive_file.path)  # open the file
-        data = bz2file.read(self.max_extracted_filesize + 1)  # get the decompressed data
-        if len(data) > self.max_extracted_filesize:
-            self.logger.warning(f'File {archive_file.path.name} too big ({len(data)}).')
-            report.status = Status.ERROR if self.max_is_error else Status.ALERT
-            report.add_details('Warning', f'File {archive_file.path.name} too big ({len(data)}).')
-            return []
-
-        if archive_file.path.suffix == ".bz2":
+    def _decompress_stream(self, archive_file: File, report: Report, dest_dir: Path,
+                           decompressor: Callable[[Path], BufferedIOBase], suffix: str) -> List[Path]:
+        """
+        Decompress a single compressed stream on disk, by chunks, and stop as soon as it is too big.
+        """
+        if archive_file.suffix == suffix:
             new_file_path = dest_dir / archive_file.path.stem
         else:
             new_file_path = dest_dir / archive_file.path.name
-        with new_file_path.open('wb') as f:
-            f.write(data)  # write an uncompressed file
+        total = 0
+        with decompressor(archive_file.path) as compressed, new_file_path.open('wb') as f:
+            while chunk := compressed.read(self.decompress_chunk_size):
+                total += len(chunk)
+                if total > self.max_extracted_filesize:
+                    break
+                f.write(chunk)  # write an uncompressed file
+        if total > self.max_extracted_filesize:
+            new_file_path.unlink()
+            self._report_limit(report, f'File {archive_file.path.name} too big (more than {self.max_extracted_filesize}).')
+            return []
         return [new_file_path]
 
+    def _extract_bz2(self, archive_file: File, report: Report, dest_dir: Path) -> List[Path]:
+        # bz2 is a TAR archive, we basically need to unzip it and then extract the files from the TAR
+        # No password can be used to protect a bz2, so we don't need to check for passwords this time
+        # Sometimes the bz2 won't contain a TAR, but the way to unzip bz2 stays the same either way
+        return self._decompress_stream(archive_file, report, dest_dir, BZ2File, '.bz2')
+
     def _extract_tar(self, archive_file: File, report: Report, dest_dir: Path) -> List[Path]:
         # tar is not a compressed archive but a directory mainly used to regroup other directories
         extracted_files: List[Path] = []
-        with TarFile(archive_file.path) as tar:
-            for file_number, tarinfo in enumerate(tar.getmembers()):
+        root_dir = dest_dir.resolve()
+        # Stream mode: the members are extracted while reading the archive, it is not scanned beforehand.
+        with tarfile.open(archive_file.path, mode='r|') as tar:
+            for file_number, tarinfo in enumerate(tar):
                 if file_number >= self.max_files_in_archive:
-                    self.logger.warning(f'Too many files ({file_number}/{self.max_files_in_archive}) in the archive, stop extracting.')
-                    report.status = Status.ERROR if self.max_is_error else Status.ALERT
-                    report.add_details('Warning', f'Too many files ({file_number}/{self.max_files_in_archive}) in the archive')
+                    self._report_limit(report, f'Too many files ({file_number}/{self.max_files_in_archive}) in the archive')
                     break
                 if not tarinfo.isfile():
                     continue
                 if tarinfo.size >= self.max_extracted_filesize:
-                    self.logger.warning(f'File {archive_file.path.name} too big ({tarinfo.size}).')
-                    report.status = Status.ERROR if self.max_is_error else Status.ALERT
-                    report.add_details('Warning', f'File {archive_file.path.name} too big ({tarinfo.size}).')
+                    self._report_limit(report, f'File {archive_file.path.name} too big ({tarinfo.size}).')
                     continue
-                tar.extract(tarinfo, dest_dir)
-                file_path = dest_dir / tarinfo.name
-                extracted_files.append(Path(file_path))
+                file_path = (dest_dir / tarinfo.name).resolve()
+                if root_dir not in file_path.parents:
+                    self.logger.warning(f'Skipping file {tarinfo.name}, outside of the archive.')
+                    continue
+                safe_create_dir(file_path.parent)
+                src = tar.extractfile(tarinfo)
+                if src is None:
+                    continue
+                with src, file_path.open('wb') as dst:
+                    shutil.copyfileobj(src, dst, self.decompress_chunk_size)
+                extracted_files.append(file_path)
         return extracted_files
 
     def _extract_gz(self, archive_file: File, report: Report, dest_dir: Path) -> List[Path]:
         # gz is just like bz2, a compressed archive with a TAR directory inside
-        gz_file = GzipFile(archive_file.path)
-        data = gz_file.read(self.max_extracted_filesize + 1)
-        if len(data) > self.max_extracted_filesize:
-            self.logger.warning(f'File {archive_file.path.name} too big ({len(data)}).')
-            report.status = Status.ERROR if self.max_is_error else Status.ALERT
-            report.add_details('Warning', f'File {archive_file.path.name} too big ({len(data)}).')
-            return []
-        if archive_file.path.suffix == ".gz":
-            new_file_path = dest_dir / archive_file.path.stem
-        else:
-            new_file_path = dest_dir / archive_file.path.name
-        with new_file_path.open('wb') as f:
-            f.write(data)  # write an uncompressed file
-        return [new_file_path]
+        return self._decompress_stream(archive_file, report, dest_dir, GzipFile, '.gz')
 
     def _extract_lzma(self, archive_file: File, report: Report, dest_dir: Path) -> List[Path]:
         # lzma is just like bz2 and gz, a compressed archive with a TAR directory inside
-        lzma_file = LZMAFile(archive_file.path)
-        data = lzma_file.read(self.max_extracted_filesize + 1)
-        if len(data) > self.max_extracted_filesize:
-            self.logger.warning(f'File {archive_file.path.name} too big ({len(data)}).')
-            report.status = Status.ERROR if self.max_is_error else Status.ALERT
-            report.add_details('Warning', f'File {archive_file.path.name} too big ({len(data)}).')
-            return []
-        if archive_file.path.suffix == ".lzma":
-            new_file_path = dest_dir / archive_file.path.stem
-        else:
-            new_file_path = dest_dir / archive_file.path.name
-        with new_file_path.open('wb') as f:
-            f.write(data)  # write an uncompressed file
-        return [new_file_path]
+        return self._decompress_stream(archive_file, report, dest_dir, LZMAFile, '.lzma')
 
     def analyse(self, task: Task, report: Report, manual_trigger: bool=False):
         if not (task.file.is_archive or task.file.is_eml or task.file.is_msg):
@@ -379,10 +454,6 @@ class Extractor(BaseWorker):
                     extracted = self._extract_iso(task.file, report, extracted_dir)
                 elif task.file.mime_type == "application/zip":
                     extracted = self._extract_zip(task.file, report, extracted_dir)
-                    if not extracted:
-                        report.clear_extras()
-                        report.clear_details()
-                        extracted = self._extract_zip(task.file, report, extracted_dir, pyzipper.AESZipFile)
                 else:
                     raise PandoraException(f'Unsupported mimetype: {task.file.mime_type}')
             except BaseException as e:
@@ -394,23 +465,22 @@ class Extractor(BaseWorker):
 
             if extracted:
                 for ef in extracted:
+                    # The file is copied by chunks by new_task, no need to load it in memory
                     with ef.open('rb') as f:
-                        sample = f.read()
-                    new_task = Task.new_task(user=task.user, sample=BytesIO(sample),
-                                             filename=ef.name,
-                                             disabled_workers=task.disabled_workers,
-                                             parent=task)
+                        new_task = Task.new_task(user=task.user, sample=f,
+                                                 filename=ef.name,
+                                                 disabled_workers=task.disabled_workers,
+                                                 parent=task)
                     pandora.add_extracted_reference(task, new_task)
                     pandora.enqueue_task(new_task)
                     tasks.append(new_task)
-            shutil.rmtree(extracted_dir)
+            self._cleanup(extracted_dir)
 
         # Try to extract attachments from EML file
         if task.file.is_eml:
             try:
                 if task.file.eml_data and task.file.eml_data.get('attachment'):
-                    extracted_dir = task.file.directory / 'extracted'
-                    safe_create_dir(extracted_dir)
+                    # The attachments are already decoded in memory, new_task writes them to disk directly.
                     for attachment in task.file.eml_data['attachment']:
                         new_task = Task.new_task(user=task.user, sample=BytesIO(base64.b64decode(attachment['raw'])),
                                                  filename=attachment['filename'],
@@ -419,7 +489,6 @@ class Extractor(BaseWorker):
                         pandora.add_extracted_reference(task, new_task)
                         pandora.enqueue_task(new_task)
                         tasks.append(new_task)
-                    shutil.rmtree(extracted_dir)
                 else:
                     report.status = Status.NOTAPPLICABLE
                     return
@@ -431,28 +500,28 @@ class Extractor(BaseWorker):
                     msg_extract_dir = task.file.directory / 'extracted_msg_attachments'
                     safe_create_dir(msg_extract_dir)
                     task.file.msg_data.save(customPath=str(msg_extract_dir), attachmentsOnly=True)
-                    for filepath in msg_extract_dir.glob('**/*'):
-                        if not filepath.is_file():
-                            continue
-                        with filepath.open('rb') as _fb:
-                            attachment = BytesIO(_fb.read())
-                        new_task = Task.new_task(user=task.user, sample=attachment,
-                                                 filename=filepath.name,
-                                                 disabled_workers=task.disabled_workers,
-                                                 parent=task)
+                    for filepath in (Path(root) / name for root, _, files in os.walk(msg_extract_dir) for name in files):
+                        with filepath.open('rb') as attachment:
+                            new_task = Task.new_task(user=task.user, sample=attachment,
+                                                     filename=filepath.name,
+                                                     disabled_workers=task.disabled_workers,
+                                                     parent=task)
                         pandora.add_extracted_reference(task, new_task)
                         pandora.enqueue_task(new_task)
                         tasks.append(new_task)
-                    shutil.rmtree(msg_extract_dir)
+                    self._cleanup(msg_extract_dir)
                 if not tasks:
                     report.status = Status.NOTAPPLICABLE
                     return
             except Exception as e:
                 self.logger.exception(e)
 
-        # wait for all the tasks to finish
+        # wait for all the tasks to finish. Most of them are done quickly, start by polling often
+        # and slow down to one check per second for the long ones.
+        wait = 0.05
         while not all(t.workers_done for t in tasks):
-            time.sleep(1)
+            time.sleep(wait)
+            wait = min(wait * 2, 1)
 
         if tasks:
             report.status = max(t.status for t in tasks)
@@ -1,7 +1,10 @@
 #!/usr/bin/env python3
 
+import json
 import logging
 
+from typing import List, Optional
+
 from mwdblib import MWDB
 from mwdblib.exc import ObjectNotFoundError, MWDBError
 
@@ -32,16 +35,36 @@ class Mwdb(BaseWorker):
             self.logger.warning(e)
             self.disabled = True
 
-    def analyse(self, task: Task, report: Report, manual_trigger: bool=False):
+    def _query(self, sha256: str) -> Optional[List[str]]:
+        """
+        Get the tags of a sample on MWDB, the answers are cached in redis and shared by all the workers.
+        :param sha256: the hash of the sample
+        :return (Optional[List[str]]): the tags, None if the sample is not on MWDB
+        """
+        cache_key = f'{self.module}:{sha256}'
+        if self.cache:
+            cached = self.redis.get(cache_key)
+            if cached is not None:
+                return json.loads(cached)
+        tags: Optional[List[str]]
         try:
-            self.logger.debug(f'analysing file {task.file.path}...')
-            result = self.mymwdb.query_file(task.file.sha256)
-            # Not error so the sample is on MWDB
-            report.status = Status.ALERT
-            # we can set all the tags in malicious entry
-            if result:
-                malicious = result.tags
-                report.add_details('malicious', set(malicious))
+            result = self.mymwdb.query_file(sha256)
+            tags = list(result.tags) if result else []
         except ObjectNotFoundError as e:
             self.logger.debug(e)
+            tags = None
+        if self.cache:
+            self.redis.set(cache_key, json.dumps(tags), ex=self.cache)
+        return tags
+
+    def analyse(self, task: Task, report: Report, manual_trigger: bool=False):
+        self.logger.debug(f'analysing file {task.file.path}...')
+        malicious = self._query(task.file.sha256)
+        if malicious is None:
             report.status = Status.NOTAPPLICABLE
+            return
+        # Not error so the sample is on MWDB
+        report.status = Status.ALERT
+        # we can set all the tags in malicious entry
+        if malicious:
+            report.add_details('malicious', set(malicious))
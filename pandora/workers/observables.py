@@ -12,7 +12,10 @@ class Observables(BaseWorker):
         try:
             task.init_observables_from_file()
             for observable in task.observables:
+                # The status of each observable is a lookup in redis, no need to check the others after the worst one.
                 report.status = observable.status
+                if report.status >= Status.ALERT:
+                    break
             if report.status >= Status.WARN:
                 report.add_details('Warning', 'At least one observable in known as bad, click on the "Observables" tab for more.')
 
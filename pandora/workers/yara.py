@@ -57,12 +57,15 @@ class YaraWorker(BaseWorker):
             self.logger.critical(f'Unable to initialize rules: {e}')
 
     def analyse(self, task: Task, report: Report, manual_trigger: bool=False):
-        if not task.file.data:
+        if not task.file.size:
             # Empty file
             report.status = Status.NOTAPPLICABLE
             return
 
-        matches = [str(_match) for _match in self.rules.match(data=task.file.data.getvalue()) if _match]
+        # yara maps the file itself. The timeout is enforced by yara too: the worker alarm
+        # cannot interrupt the scan, python signal handlers only run once the C call returns.
+        matches = [str(_match) for _match in self.rules.match(filepath=str(task.file.path), timeout=self.timeout)
+                   if _match]
         if matches:
             report.status = Status.ALERT
             report.add_details('Rules matches', matches)
@@ -21,19 +21,29 @@ class YaraSignatureBaseWorker(YaraWorker):
                       'gen_webshells_ext_vars.yar',
                       'thor_inverse_matches.yar', 'yara_mixed_ext_vars.yar']
     last_change: Optional[float] = None
-
-    def rules_with_external_vars(self, filename: str, filepath: str, filetype: str, owner: str) -> yara.Rules:
-        extension = os.path.splitext(filename)[1]
+    last_change_external: Optional[float] = None
+    _rules_external: Optional[yara.Rules] = None
+
+    @property
+    def rules_with_external_vars(self) -> yara.Rules:
+        """
+        Rules requiring external variables. They're compiled with empty values,
+        the actual values are passed when matching, so they're only recompiled when a file changes.
+        """
         yara_files = [y_file for y_file in self.rulespath.glob('**/*.yar') if y_file.name in self.needs_external]
-        rules = yara.compile(filepaths={str(path): str(path) for path in yara_files},
-                             includes=True,
-                             externals={'filename': filename, 'filepath': filepath,
-                                        'extension': extension, 'filetype': filetype,
-                                        'owner': owner})
-        return rules
+        most_recent = max(entry.stat().st_mtime for entry in yara_files)
+        if (self._rules_external is None or not self.last_change_external
+                or self.last_change_external < most_recent):
+            self._rules_external = yara.compile(filepaths={str(path): str(path) for path in yara_files},
+                                                includes=True,
+                                                externals={'filename': '', 'filepath': '',
+                                                           'extension': '', 'filetype': '',
+                                                           'owner': ''})
+            self.last_change_external = most_recent
+        return self._rules_external
 
     def analyse(self, task: Task, report: Report, manual_trigger: bool=False):
-        if not task.file.data:
+        if not task.file.size:
             report.status = Status.NOTAPPLICABLE
             return
 
@@ -41,10 +51,11 @@ class YaraSignatureBaseWorker(YaraWorker):
 
         filetype = task.file.type  # only match in generic_anomalies.yar for "GIF"
         owner = ''  # only match in yara_mixed_ext_vars.yar for "confluence"
-        rules_external = self.rules_with_external_vars(
-            filename=task.file.original_filename, filepath=task.file.original_filename,
-            filetype=filetype, owner=owner)
-        matches = [str(match) for match in rules_external.match(data=task.file.data.getvalue()) if match]
+        externals = {'filename': task.file.original_filename, 'filepath': task.file.original_filename,
+                     'extension': os.path.splitext(task.file.original_filename)[1],
+                     'filetype': filetype, 'owner': owner}
+        rules_matches = self.rules_with_external_vars.match(filepath=str(task.file.path), externals=externals, timeout=self.timeout)
+        matches = [str(match) for match in rules_matches if match]
         if matches:
             report.status = Status.ALERT
             report.add_details('Rules matches', matches)
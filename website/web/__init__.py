@@ -4,10 +4,9 @@ import functools
 import json
 import logging
 import operator
-import traceback
 
 from collections import defaultdict
-from datetime import datetime, timedelta
+from datetime import datetime, timedelta, timezone
 from importlib.metadata import version
 from io import BytesIO
 from pathlib import Path
@@ -23,6 +22,7 @@ from flask import (Flask, request, session, abort, render_template,
                    redirect, send_file, url_for, flash)
 from flask_restx import Api  # type: ignore
 from flask_bootstrap import Bootstrap5  # type: ignore
+from jinja2 import FileSystemBytecodeCache
 from pymisp import MISPEvent, PyMISP
 from pymisp.abstract import describe_types
 from werkzeug.security import check_password_hash
@@ -64,10 +64,20 @@ Bootstrap5(app)
 app.config['BOOTSTRAP_SERVE_LOCAL'] = True
 app.config['SESSION_COOKIE_NAME'] = 'pandora'
 app.config['SESSION_COOKIE_SAMESITE'] = 'Strict'
+# send_file of a path only sets the header and lets the web server in front send the file
+app.config['USE_X_SENDFILE'] = get_config('generic', 'use_x_sendfile')
 app.debug = get_config('generic', 'debug_web')
 API_LOG_TRACEBACK = get_config('generic', 'debug_web')
 
+# Keep the compiled templates between restarts, and only check if they changed in debug mode.
+app.jinja_env.bytecode_cache = FileSystemBytecodeCache()
+app.jinja_env.auto_reload = app.debug
+app.config['TEMPLATES_AUTO_RELOAD'] = app.debug
+
 flask_session.Session(app=app)
+# The sessions only contain strings and booleans (flask-login, CSRF token, flashed messages), no need for pickle.
+# Sessions stored with pickle fail to load and are replaced by a new one.
+app.session_interface.serializer = json  # type: ignore
 login_manager = flask_login.LoginManager(app=app)
 flask_moment.Moment(app=app)
 app.config['WTF_CSRF_CHECK_DEFAULT'] = False
@@ -107,10 +117,14 @@ status_icons = defaultdict(default_icon, {
 })
 
 
+# Nothing in there changes, no need to build a new dict for each template
+template_enums = dict(action=Action, status=Status, status_icons=status_icons)
+
+
 @app.context_processor
 def inject_enums():
     '''All the templates have the Action and Status enum'''
-    return dict(action=Action, status=Status, status_icons=status_icons)
+    return template_enums
 
 # ##### Global methods passed to jinja
 
@@ -138,6 +152,10 @@ def _load_user_from_request(req):
     return None
 
 
+# Do not store the user on every request, only if the IP changed or it was last seen more than that ago.
+USER_STORE_INTERVAL = timedelta(seconds=30)
+
+
 @app.before_request
 def update_user():
     if (user := _load_user_from_request(request)):
@@ -146,9 +164,14 @@ def update_user():
         if flask_login.current_user.name:
             # If the user doesn't have a name, it is session based, no need to check
             csrf.protect()
-        flask_login.current_user.last_ip = src_request_ip(request)
-        flask_login.current_user.last_seen = datetime.now()
-        flask_login.current_user.store()
+        last_ip = src_request_ip(request)
+        now = datetime.now(timezone.utc)
+        last_seen = flask_login.current_user.last_seen
+        if (flask_login.current_user.last_ip != last_ip or last_seen.tzinfo is None
+                or now - last_seen > USER_STORE_INTERVAL):
+            flask_login.current_user.last_ip = last_ip
+            flask_login.current_user.last_seen = now
+            flask_login.current_user.store()
     else:
         # Note: session.sid comes from flask_session
         user = User(session_id=session.sid, last_ip=src_request_ip(request))  # type: ignore
@@ -156,9 +179,15 @@ def update_user():
         flask_login.login_user(user)
 
 
+@functools.lru_cache(1024)
+def _parse_isoformat(iso: str) -> datetime:
+    # The same dates are displayed on every refresh of the pages, and datetime objects are immutable
+    return datetime.fromisoformat(iso)
+
+
 @app.template_filter()
 def to_datetime(iso):
-    return datetime.fromisoformat(str(iso)) if iso else datetime.now()
+    return _parse_isoformat(str(iso)) if iso else datetime.now()
 
 
 def html_answer(func):
@@ -166,9 +195,12 @@ def html_answer(func):
     def wrapper(*args, **kwargs):
         try:
             res = func(*args, **kwargs)
-        except (PandoraException, Exception):
+        except (PandoraException, Forbidden):
+            # Expected errors (unknown task, missing rights...), no need for a traceback
+            return abort(404)
+        except Exception:
             if API_LOG_TRACEBACK:
-                traceback.print_exc()
+                app.logger.exception(f'Error in {func.__name__}')
             return abort(404)
         else:
             return res
@@ -271,14 +303,16 @@ def task_misp_submit(task_id, seed=None):
     return redirect(url_for('api_analysis', task_id=task_id, seed=seed))
 
 
-@app.route('/task-download/<task_id>/seed-<seed>/<source>', methods=['GET'], strict_slashes=False)
-@app.route('/task-download/<task_id>/seed-<seed>/<source>/<int:idx>', methods=['GET'], strict_slashes=False)
-@app.route('/task-download/<task_id>/<source>', methods=['GET'], strict_slashes=False)
-@app.route('/task-download/<task_id>/<source>/<int:idx>', methods=['GET'], strict_slashes=False)
+# The URL map only matches the known sources, anything else is a 404
+download_source = '<any(img, pdf, txt, zip, txt_preview, misp):source>'
+
+
+@app.route(f'/task-download/<task_id>/seed-<seed>/{download_source}', methods=['GET'], strict_slashes=False)
+@app.route(f'/task-download/<task_id>/seed-<seed>/{download_source}/<int:idx>', methods=['GET'], strict_slashes=False)
+@app.route(f'/task-download/<task_id>/{download_source}', methods=['GET'], strict_slashes=False)
+@app.route(f'/task-download/<task_id>/{download_source}/<int:idx>', methods=['GET'], strict_slashes=False)
 @html_answer
 def api_task_download(task_id, source, seed=None, idx=None):
-    if source not in ('img', 'pdf', 'txt', 'zip', 'txt_preview', 'misp'):
-        raise Unsupported(f"unexpected source '{source}'")
     task = pandora.get_task(task_id=task_id)
     if not task:
         raise PandoraException('analysis not found')
@@ -310,7 +344,8 @@ def api_task_download(task_id, source, seed=None, idx=None):
         to_return = BytesIO()
         with pyzipper.AESZipFile(to_return, 'w', encryption=pyzipper.WZ_AES) as archive:
             archive.setpassword(get_config('generic', 'sample_password').encode())
-            archive.writestr(task.file.original_filename, task.file.data.getvalue())
+            # Read the sample from disk by chunks, not the whole file in memory.
+            archive.write(task.file.path, arcname=task.file.original_filename)
         to_return.seek(0)
         return send_file(to_return, download_name=f'{task.file.path.name}.zip')
 